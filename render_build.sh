@@ -7,4 +7,6 @@ npm run build
 
 pipenv install
 
+pipenv run compress-static
+
 pipenv run upgrade
@@ -1,27 +1,184 @@
-  
 import os
+from flask import flash, g
 from flask_admin import Admin
+from flask_admin.actions import action
+from wtforms import PasswordField, ValidationError
+from markupsafe import Markup, escape
+from sqlalchemy import select, update, delete, literal, text
+from sqlalchemy.orm import selectinload
 from .models import db, User, Product, ProductImage
+from .cloudinary_client import transformed_url, destroy_images
+from .endpoints import bcrypt
 from flask_admin.contrib.sqla import ModelView
 
-class UserView(ModelView):
-    column_list = ('id', 'email', 'password', 'role', 'picture_url', 'picture_public_id')
+# Below this number of rows the exact COUNT(*) is cheap enough
+COUNT_ESTIMATE_THRESHOLD = 10000
+# Small square version of the images for the list pages
+THUMBNAIL_TRANSFORMATION = "c_thumb,w_60,h_60/f_auto,q_auto"
 
-class ProductView(ModelView):
+
+def thumbnail(url):
+    return Markup('<img src="%s" width="60" height="60" loading="lazy">' % escape(transformed_url(url, THUMBNAIL_TRANSFORMATION)))
+
+
+class BaseView(ModelView):
+    page_size = 50
+    can_set_page_size = True
+
+    def estimate_count(self):
+        """
+        Row count from the postgres statistics (updated by autovacuum/ANALYZE), None on other databases
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        estimate = self.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": self.model.__tablename__}
+        ).scalar()
+        # -1 means the table was never analyzed
+        if estimate is None or estimate < 0:
+            return None
+        return estimate
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        # Without search/filters the pager only needs an approximate total, skip the COUNT(*) on big tables
+        g.admin_count_estimate = None
+        if not search and not filters:
+            estimate = self.estimate_count()
+            if estimate is not None and estimate >= COUNT_ESTIMATE_THRESHOLD:
+                g.admin_count_estimate = estimate
+        return super().get_list(page, sort_column, sort_desc, search, filters, execute=execute, page_size=page_size)
+
+    def get_count_query(self):
+        if g.get('admin_count_estimate') is not None:
+            return self.session.query(literal(g.admin_count_estimate))
+        return super().get_count_query()
+
+
+class UserView(BaseView):
+    # The password hashes are not shown in the list
+    column_list = ('id', 'email', 'role', 'picture_url', 'picture_public_id')
+    # The form has an empty password field instead of the hash, it is hashed like in /register
+    form_excluded_columns = ('password',)
+    form_extra_fields = {
+        'new_password': PasswordField('Password', description='Leave it empty to keep the current password')
+    }
+    column_searchable_list = ('email',)
+    column_filters = ('role',)
+    column_formatters = {
+        'picture_url': lambda view, context, model, name: thumbnail(model.picture_url) if model.picture_url else ''
+    }
+
+    def on_model_change(self, form, model, is_created):
+        if form.new_password.data:
+            model.password = bcrypt.generate_password_hash(form.new_password.data).decode('utf-8')
+        elif is_created:
+            raise ValidationError('A password is required')
+
+    @action('delete', 'Delete', 'Are you sure you want to delete the selected users and their pictures?')
+    def action_delete(self, ids):
+        ids = [int(id) for id in ids]
+        public_ids = self.session.scalars(select(User.picture_public_id).where(User.id.in_(ids))).all()
+        try:
+            result = self.session.execute(delete(User).where(User.id.in_(ids)))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            flash(f"Failed to delete users: {str(e)}", 'error')
+            return
+        flash(f"{result.rowcount} users were successfully deleted.", 'success')
+        delete_remote_images(public_ids)
+
+
+class ProductView(BaseView):
     column_list = ('id', 'name', 'description', 'price', 'images')
+    column_searchable_list = ('name',)
+    column_filters = ('price',)
+    column_formatters = {
+        'images': lambda view, context, model, name: Markup(' ').join(thumbnail(image.url) for image in model.images)
+    }
+
+    def get_query(self):
+        # Load the images of the whole page in one extra query instead of one query per product
+        return super().get_query().options(selectinload(Product.images))
+
+    @action('delete', 'Delete', 'Are you sure you want to delete the selected products and their images?')
+    def action_delete(self, ids):
+        ids = [int(id) for id in ids]
+        public_ids = self.session.scalars(select(ProductImage.public_id).where(ProductImage.product_id.in_(ids))).all()
+        try:
+            self.session.execute(delete(ProductImage).where(ProductImage.product_id.in_(ids)))
+            result = self.session.execute(delete(Product).where(Product.id.in_(ids)))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            flash(f"Failed to delete products: {str(e)}", 'error')
+            return
+        flash(f"{result.rowcount} products were successfully deleted.", 'success')
+        delete_remote_images(public_ids)
+
+    def reprice(self, ids, factor):
+        ids = [int(id) for id in ids]
+        try:
+            result = self.session.execute(
+                update(Product).where(Product.id.in_(ids)).values(price=Product.price * factor)
+            )
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            flash(f"Failed to update the prices: {str(e)}", 'error')
+            return
+        flash(f"{result.rowcount} prices were successfully updated.", 'success')
+
+    # The action names go through gettext, that's why the % is escaped
+    @action('increase_price', 'Increase price 10%%', 'Increase the price of the selected products by 10%?')
+    def action_increase_price(self, ids):
+        self.reprice(ids, 1.1)
+
+    @action('decrease_price', 'Decrease price 10%%', 'Decrease the price of the selected products by 10%?')
+    def action_decrease_price(self, ids):
+        self.reprice(ids, 0.9)
+
+
+class ProductImageView(BaseView):
+    column_list = ('id', 'product_id', 'url', 'public_id')
+    column_filters = ('product_id',)
+    column_formatters = {
+        'url': lambda view, context, model, name: thumbnail(model.url)
+    }
+
+    @action('delete', 'Delete', 'Are you sure you want to delete the selected images?')
+    def action_delete(self, ids):
+        ids = [int(id) for id in ids]
+        public_ids = self.session.scalars(select(ProductImage.public_id).where(ProductImage.id.in_(ids))).all()
+        try:
+            result = self.session.execute(delete(ProductImage).where(ProductImage.id.in_(ids)))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            flash(f"Failed to delete images: {str(e)}", 'error')
+            return
+        flash(f"{result.rowcount} images were successfully deleted.", 'success')
+        delete_remote_images(public_ids)
+
+
+def delete_remote_images(public_ids):
+    # The rows are already gone, if Cloudinary fails the images are only orphaned, not lost
+    try:
+        destroy_images(public_ids)
+    except Exception as e:
+        flash(f"The images could not be deleted from Cloudinary: {str(e)}", 'warning')
 
-class ProductImageView(ModelView):
-    column_list = ('id', 'product_id', 'image_url', 'public_id')
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(UserView(User, db.session))
     admin.add_view(ProductView(Product, db.session))
     admin.add_view(ProductImageView(ProductImage, db.session))
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
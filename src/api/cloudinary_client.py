@@ -0,0 +1,145 @@
+"""
+Cloudinary setup and helpers used by the endpoints to upload and delete images.
+The SDK is only imported and configured the first time an image is uploaded or deleted,
+so workers and CLI commands that never touch images don't pay for it.
+The SDK uploads through a module level urllib3 pool that only keeps 1 connection per host,
+here it is replaced by a bigger pool so concurrent uploads (threads or gevent greenlets)
+reuse their connections instead of opening a new TLS connection each time.
+"""
+import os
+import queue
+import logging
+import threading
+from flask import current_app
+
+# Every image of this project is stored inside this folder
+UPLOAD_FOLDER = "/Practice-Projects/cloudinary-study-py"
+# Images used when the user/product has no image, they are not referenced by any public_id column
+DEFAULT_AVATAR_URL = "https://res.cloudinary.com/dbiyjz0g3/image/upload/v1748279029/Practice-Projects/cloudinary-study-py/avatar_f6r5cf.jpg"
+DEFAULT_PRODUCT_IMAGE_URL = "https://res.cloudinary.com/dbiyjz0g3/image/upload/v1748280952/Practice-Projects/cloudinary-study-py/no_image_available_vh4dpj.png"
+DEFAULT_PUBLIC_IDS = (
+    "Practice-Projects/cloudinary-study-py/avatar_f6r5cf",
+    "Practice-Projects/cloudinary-study-py/no_image_available_vh4dpj",
+)
+
+# Square versions of the profile picture, generated by Cloudinary when the picture is uploaded
+AVATAR_VARIANTS = {
+    "small": "c_fill,g_face,w_48,h_48,q_auto",
+    "medium": "c_fill,g_face,w_96,h_96,q_auto",
+    "large": "c_fill,g_face,w_256,h_256,q_auto",
+}
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_uploader = None
+_deletion_queue = None
+
+
+def setup_cloudinary(app):
+    # Make sure to set your Cloudinary credentials in the environment variables
+    app.config.setdefault('CLOUDINARY_CLOUD_NAME', os.getenv("CLOUDINARY_CLOUD_NAME", "your_cloud_name"))
+    app.config.setdefault('CLOUDINARY_API_KEY', os.getenv("CLOUDINARY_API_KEY", "your_api_key"))
+    app.config.setdefault('CLOUDINARY_API_SECRET', os.getenv("CLOUDINARY_API_SECRET", "your_api_secret"))
+    app.config.setdefault('CLOUDINARY_POOL_SIZE', int(os.getenv("CLOUDINARY_POOL_SIZE", 50)))
+
+
+def get_uploader():
+    global _uploader
+    if _uploader is not None:
+        return _uploader
+    with _lock:
+        if _uploader is None:
+            import cloudinary
+            import cloudinary.uploader
+            from cloudinary.utils import get_http_connector
+
+            config = current_app.config
+            cloudinary.config(
+                cloud_name = config['CLOUDINARY_CLOUD_NAME'],
+                api_key = config['CLOUDINARY_API_KEY'],
+                api_secret = config['CLOUDINARY_API_SECRET'],
+                secure=True
+            )
+            options = dict(cloudinary.CERT_KWARGS)
+            # maxsize: connections kept alive per host, block=False opens extra ones under bursts instead of waiting
+            options['maxsize'] = config['CLOUDINARY_POOL_SIZE']
+            options['block'] = False
+            cloudinary.uploader._http = get_http_connector(cloudinary.config(), options)
+            _uploader = cloudinary.uploader
+    return _uploader
+
+
+def upload_image(image_file, eager=None):
+    """
+    Uploads one image to the project folder and returns {"url": ..., "public_id": ...}
+    eager: optional list of transformations that Cloudinary generates right after the upload
+    """
+    options = {}
+    if eager:
+        # Generated in the background, the upload doesn't wait for them
+        options = {"eager": eager, "eager_async": True}
+    upload_result = get_uploader().upload(image_file, folder=UPLOAD_FOLDER, **options)
+    return {
+        "url": upload_result['secure_url'],
+        "public_id": upload_result['public_id']
+    }
+
+
+def destroy_image(public_id):
+    return get_uploader().destroy(public_id)
+
+
+def _deletion_worker(deletion_queue, uploader):
+    while True:
+        public_id = deletion_queue.get()
+        try:
+            uploader.destroy(public_id)
+        except Exception as e:
+            # The image stays as an orphan, "flask reconcile-assets" can delete it later
+            logger.warning("Failed to delete image %s from Cloudinary: %s", public_id, e)
+
+
+def queue_image_deletion(public_id):
+    """
+    Deletes the image in a background thread of this worker, so the response doesn't wait for Cloudinary
+    """
+    global _deletion_queue
+    if not public_id or public_id in DEFAULT_PUBLIC_IDS:
+        return
+    uploader = get_uploader()
+    with _lock:
+        if _deletion_queue is None:
+            _deletion_queue = queue.Queue()
+            threading.Thread(target=_deletion_worker, args=(_deletion_queue, uploader), daemon=True).start()
+    _deletion_queue.put(public_id)
+
+
+def destroy_images(public_ids):
+    """
+    Deletes several images with the Admin API (100 public_ids per call instead of one call per image)
+    """
+    get_uploader()  # makes sure the SDK is configured
+    import cloudinary.api
+    # The default images are shared by every row that has no image of its own
+    public_ids = [public_id for public_id in public_ids if public_id and public_id not in DEFAULT_PUBLIC_IDS]
+    if not public_ids:
+        return
+    for start in range(0, len(public_ids), 100):
+        cloudinary.api.delete_resources(public_ids[start:start + 100])
+
+
+def transformed_url(url, transformation):
+    """
+    Adds a transformation (ex: "c_thumb,w_60,h_60/f_auto,q_auto") to a Cloudinary delivery url,
+    so the browser downloads a small version instead of the original image.
+    Urls that are not from Cloudinary are returned unchanged.
+    """
+    # Cloudinary urls look like https://res.cloudinary.com/<cloud>/image/upload/v123/folder/name.jpg
+    marker = "/image/upload/"
+    if not url or marker not in url:
+        return url
+    return url.replace(marker, marker + transformation + "/", 1)
+
+
+def avatar_variants(url):
+    return {name: transformed_url(url, transformation) for name, transformation in AVATAR_VARIANTS.items()}
@@ -1,13 +1,50 @@
 
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
 import click
 from api.models import db, User
+from api.static_files import compress_static_files
+from api.compression import available_encodings, compress_bytes
+from api.reconcile import CloudinaryAssetClient, FakeAssetClient, reconcile_assets
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
 Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration 
 with youy database, for example: Import the price of bitcoin every night as 12am
 """
+
+
+class LazyMigrateGroup(click.Group):
+    """
+    The "flask db" commands of flask_migrate, alembic is only imported when one of them runs
+    """
+    def __init__(self, app, db, **kwargs):
+        super().__init__(**kwargs)
+        self.app = app
+        self.db = db
+
+    def load(self):
+        if 'migrate' not in self.app.extensions:
+            from flask_migrate import Migrate
+            Migrate(self.app, self.db, compare_type=True)
+        from flask_migrate.cli import db as db_cli_group
+        return db_cli_group
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # The real group parses the options (-d/--directory, -x) and runs its subcommands
+        return self.load().make_context(info_name, args, parent=parent, **extra)
+
+    def invoke(self, ctx):
+        return ctx.command.invoke(ctx)
+
+
 def setup_commands(app):
+    # flask db upgrade, flask db migrate...
+    app.cli.add_command(LazyMigrateGroup(app, db, name="db", help="Perform database migrations."))
     
     """ 
     This is an example command "insert-test-users" that you can run from the command line
@@ -31,4 +68,98 @@ def setup_commands(app):
 
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        pass
+
+    """
+    Generates the precompressed .gz/.br versions of the front end build so the static
+    route can serve them without compressing on every request. Run it after "npm run build":
+    $ flask compress-static
+    """
+    @app.cli.command("compress-static")
+    @click.option("--folder", default=None, help="Folder to compress, defaults to the public folder")
+    @click.option("--level", default=9, help="gzip compression level (1-9)")
+    def compress_static(folder, level):
+        if folder is None:
+            folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../public/')
+        generated = compress_static_files(folder, level=level)
+        for path in generated:
+            print("Compressed: ", path)
+        print(len(generated), "compressed files created")
+
+    """
+    Measures the CPU cost vs the bytes saved of compressing a product list response
+    similar to the one returned by GET /products:
+    $ flask benchmark-compression --products 500
+    """
+    @app.cli.command("benchmark-compression")
+    @click.option("--products", default=500, help="Number of products in the payload")
+    @click.option("--repeat", default=20, help="Times each level is measured")
+    def benchmark_compression(products, repeat):
+        payload = json.dumps({"products": [
+            {
+                "id": x,
+                "name": "Product " + str(x),
+                "description": "Description of the product number " + str(x) + ", with enough text to look real.",
+                "price": round(x * 1.37, 2),
+                "images": [
+                    {"id": x * 5 + y, "url": "https://res.cloudinary.com/demo/image/upload/v1748280952/Practice-Projects/cloudinary-study-py/product_" + str(x) + "_" + str(y) + ".jpg"}
+                    for y in range(5)
+                ]
+            }
+            for x in range(1, products + 1)
+        ]}).encode('utf-8')
+        print("Payload:", len(payload), "bytes")
+        levels = {"gzip": [1, 6, 9], "br": [1, 4, 6, 11]}
+        for encoding in available_encodings():
+            for level in levels[encoding]:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    compressed = compress_bytes(payload, encoding, gzip_level=level, brotli_level=level)
+                elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+                saved = 100 - len(compressed) * 100 / len(payload)
+                print(f"{encoding:5} level {level:2}: {len(compressed):8} bytes ({saved:.1f}% saved) {elapsed_ms:.2f} ms")
+
+    """
+    Measures the cold start of a gunicorn worker: the time a new python process takes to
+    import wsgi.py and build the app (median of several runs, every run is a fresh process):
+    $ flask benchmark-startup --runs 10
+    """
+    @app.cli.command("benchmark-startup")
+    @click.option("--runs", default=10, help="Number of fresh processes to measure")
+    def benchmark_startup(runs):
+        src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+        code = "import time; start = time.perf_counter(); import wsgi; print(time.perf_counter() - start)"
+        timings = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", code], cwd=src_dir, capture_output=True, text=True, check=True)
+            timings.append(float(output.stdout.strip().splitlines()[-1]) * 1000)
+        print(f"wsgi import + create_app: median {statistics.median(timings):.1f} ms, min {min(timings):.1f} ms, max {max(timings):.1f} ms")
+
+    """
+    Compares the images of the Cloudinary folder with the public_ids saved in the database
+    and reports the drift, with --delete the images without a row are deleted:
+    $ flask reconcile-assets --delete
+    To try it without a Cloudinary account, --fake-listing reads the images from a json file
+    (a list of public_ids or of {"public_id": ..., "created_at": ...} objects) instead of the Admin API:
+    $ flask reconcile-assets --fake-listing images.json --page-size 2
+    """
+    @app.cli.command("reconcile-assets")
+    @click.option("--delete", is_flag=True, help="Delete the orphaned images from Cloudinary")
+    @click.option("--min-age", default=60, help="Ignore the images uploaded less than these minutes ago")
+    @click.option("--page-size", default=500, help="Images listed per request")
+    @click.option("--fake-listing", type=click.Path(exists=True, dir_okay=False), default=None,
+                  help="Json file with the images, used instead of Cloudinary")
+    def reconcile_assets_command(delete, min_age, page_size, fake_listing):
+        if fake_listing is not None:
+            with open(fake_listing) as f:
+                client = FakeAssetClient(json.load(f), page_size=page_size)
+        else:
+            # ASSET_CLIENT can be set to a FakeAssetClient when the app is built in code (tests)
+            client = app.config.get("ASSET_CLIENT") or CloudinaryAssetClient(page_size=page_size)
+        try:
+            totals = reconcile_assets(client, delete=delete, min_age=min_age)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        print("Orphaned images in Cloudinary:", totals["orphaned"], "(deleted:", str(totals["deleted"]) + ")")
+        print("Rows without image in Cloudinary:", totals["missing"])
+        print("Recent images skipped:", totals["skipped"])
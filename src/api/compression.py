@@ -0,0 +1,144 @@
+"""
+Negotiated gzip/brotli compression for the API responses.
+Registered as an after_request hook, it compresses JSON (and other text) responses above
+COMPRESS_MIN_SIZE when the client sends a matching Accept-Encoding header.
+Streamed responses are compressed chunk by chunk so they keep streaming.
+"""
+import os
+import zlib
+from flask import request
+
+try:
+    import brotli  # Optional, without it only gzip is offered
+except ImportError:
+    brotli = None
+
+DEFAULT_CONFIG = {
+    'COMPRESS_ENABLED': os.getenv('COMPRESS_ENABLED', '1') == '1',
+    # bytes, smaller bodies cost more CPU than what they save
+    'COMPRESS_MIN_SIZE': int(os.getenv('COMPRESS_MIN_SIZE', 1024)),
+    'COMPRESS_GZIP_LEVEL': int(os.getenv('COMPRESS_GZIP_LEVEL', 6)),
+    # brotli 4-5 is similar in speed to gzip 6 but smaller
+    'COMPRESS_BROTLI_LEVEL': int(os.getenv('COMPRESS_BROTLI_LEVEL', 4)),
+    'COMPRESS_MIMETYPES': [
+        'application/json',
+        'text/html',
+        'text/plain',
+        'text/css',
+        'text/javascript',
+        'application/javascript',
+        'image/svg+xml',
+    ],
+}
+
+
+def available_encodings():
+    if brotli is not None:
+        return ('br', 'gzip')
+    return ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    # Pick the first encoding we support (br is preferred) that the client accepts
+    for encoding in available_encodings():
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+class Compressor:
+    """
+    Incremental compressor with the same interface for gzip and brotli,
+    so the same code works for normal and streamed responses.
+    """
+    def __init__(self, encoding, gzip_level=6, brotli_level=4):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_level)
+        else:
+            # wbits=31 writes the gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            # Flush on each chunk so a streamed client receives the data right away
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data, encoding, gzip_level=6, brotli_level=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_level)
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def should_compress(response, config):
+    if not config['COMPRESS_ENABLED']:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    # Already compressed (precompressed static files, images, etc.)
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return False
+    # send_file responses are passed through as file wrappers, the static layer handles those
+    if response.direct_passthrough:
+        return False
+    if not response.is_streamed and response.content_length is not None \
+            and response.content_length < config['COMPRESS_MIN_SIZE']:
+        return False
+    return True
+
+
+def compress_response(response, accept_encodings, config):
+    if not should_compress(response, config):
+        return response
+    # From here the body depends on the request headers, caches must know it
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # The final size is unknown, so the threshold can't be applied to streams
+        compressor = Compressor(encoding, config['COMPRESS_GZIP_LEVEL'], config['COMPRESS_BROTLI_LEVEL'])
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress_bytes(data, encoding, config['COMPRESS_GZIP_LEVEL'], config['COMPRESS_BROTLI_LEVEL']))
+
+    response.headers['Content-Encoding'] = encoding
+    # A compressed body is a different representation, it needs a different ETag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag("%s-%s" % (etag, encoding), weak)
+    return response
+
+
+def setup_compression(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, request.accept_encodings, app.config)
@@ -0,0 +1,450 @@
+"""
+Users and products endpoints (registered without prefix by create_app)
+"""
+from flask import Blueprint, request, jsonify
+from flask_bcrypt import Bcrypt
+from flask_jwt_extended import get_jwt_identity, jwt_required, create_access_token
+from api.models import db, User, Product, ProductImage
+from api.rate_limit import rate_limit, upload_admission, client_ip, login_email
+from api.uploads import upload_limits
+from api.replicas import read_only
+# Relevant for this Study Project ##############################################################################################
+from api.cloudinary_client import upload_image, destroy_image, queue_image_deletion, AVATAR_VARIANTS, DEFAULT_AVATAR_URL, DEFAULT_PRODUCT_IMAGE_URL
+################################################################################################################################
+
+endpoints = Blueprint('endpoints', __name__)
+bcrypt = Bcrypt()
+
+
+# User register endpoint
+@endpoints.route('/register', methods=['POST'])
+@rate_limit("register", "REGISTER")
+@upload_admission
+@upload_limits(max_file_size=2 * 1024 * 1024)
+def register_user():
+    """
+    Form data example:
+    email= "user@email.com"
+    password= "userpassword"
+    role= "user"  # Optional, default is "user"
+    image= <image file>  # Optional, can upload an image file
+    """
+    form = request.form
+    if not form or "email" not in form or "password" not in form:
+        return jsonify({"error": "Missing email or password"}), 400
+    email = form["email"]
+    password = form["password"]
+    role = form.get("role", "user")  # Default role is "user"
+    if role not in ["user", "admin"]:
+        return jsonify({"error": "Invalid role, must be 'user' or 'admin'"}), 400
+    # Check if the user already exists
+    existing_user = User.query.filter_by(email=email).first()
+    if existing_user:
+        return jsonify({"error": "User with this email already exists"}), 400
+    # Validate password length
+    if len(password) < 6:
+        return jsonify({"error": "Password must be at least 6 characters long"}), 400
+    # Hash the password
+    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+
+    # Check if the image file is present
+    if 'image' in request.files:
+        # Check if the image file is valid
+        image_file = request.files['image']
+        if image_file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        # Validate image file type
+        if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            return jsonify({"error": "Invalid image format"}), 400
+        # The image file size (max 2MB) is checked by @upload_limits while the file is received
+
+        try:
+        # Relevant for this Study Project ##############################################################################################
+            # Upload one image to Cloudinary
+            upload_result = upload_image(image_file, eager=list(AVATAR_VARIANTS.values()))
+            image_url = upload_result['url']
+            image_public_id = upload_result['public_id']
+        ################################################################################################################################
+        except Exception as e:
+            return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
+    else:
+        image_url = DEFAULT_AVATAR_URL
+        image_public_id = None
+    
+    # Create the new user
+    new_user = User(email=email, password=hashed_password, role=role, picture_url=image_url, picture_public_id=image_public_id)
+    try:
+        db.session.add(new_user)
+        db.session.commit()
+
+        return jsonify({"message": "User registered successfully"}), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to register user: {str(e)}"}), 500
+    
+
+
+# User login endpoint with JWT
+@endpoints.route('/login', methods=['POST'])
+@rate_limit("login", "LOGIN", identities=(client_ip, login_email))
+def login_user():
+    """
+    Body example:
+    {
+        "email": "user1@email.com",
+        "password": "user1password"
+    }
+    """
+    body = request.get_json()
+    if not body or "email" not in body or "password" not in body:
+        return jsonify({"error": "Missing email or password"}), 400
+
+    email = body["email"]
+    password = body["password"]
+
+    user = User.query.filter_by(email=email).first()
+    if not user or not bcrypt.check_password_hash(user.password, password):
+        return jsonify({"error": "Invalid email or password"}), 401
+
+    access_token = create_access_token(identity=str(user.id))
+    return jsonify({"access_token": access_token, "user": user.serialize()}), 200
+
+
+# User profile endpoint
+@endpoints.route('/users/profile', methods=['GET'])
+@jwt_required()
+def get_user_profile():
+    """
+    Returns the profile of the currently logged-in user
+    """
+    current_user = get_jwt_identity()
+    user = User.query.get(int(current_user))
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"user": user.serialize()}), 200
+
+
+# User profile picture update endpoint
+@endpoints.route('/users/profile/picture', methods=['PUT'])
+@jwt_required()
+@upload_admission
+@upload_limits(max_file_size=2 * 1024 * 1024)
+def update_profile_picture():
+    """
+    Form data example:
+    image= <image file>
+    Replaces the profile picture of the currently logged-in user, the old picture is deleted from Cloudinary
+    """
+    current_user = get_jwt_identity()
+    if 'image' not in request.files:
+        return jsonify({"error": "Missing image file"}), 400
+    image_file = request.files['image']
+    if image_file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    # Validate image file type
+    if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+        return jsonify({"error": "Invalid image format"}), 400
+
+    try:
+    # Relevant for this Study Project ##############################################################################################
+        # The square variants are generated by Cloudinary right after the upload
+        upload_result = upload_image(image_file, eager=list(AVATAR_VARIANTS.values()))
+    ################################################################################################################################
+    except Exception as e:
+        return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
+
+    try:
+        # Lock the row so two concurrent updates can't both read the same old picture
+        user = User.query.filter_by(id=int(current_user)).with_for_update().populate_existing().first()
+        if not user:
+            db.session.rollback()
+            queue_image_deletion(upload_result['public_id'])
+            return jsonify({"error": "User not found"}), 404
+        old_public_id = user.picture_public_id
+        user.picture_url = upload_result['url']
+        user.picture_public_id = upload_result['public_id']
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        # The new image is not used by anyone
+        queue_image_deletion(upload_result['public_id'])
+        return jsonify({"error": f"Failed to update profile picture: {str(e)}"}), 500
+
+    # The old picture is deleted in the background, the response doesn't wait for Cloudinary
+    queue_image_deletion(old_public_id)
+    return jsonify({"message": "Profile picture updated successfully", "user": user.serialize()}), 200
+
+
+# Product create endpoint
+# Images: receive an image file and upload it to Cloudinary
+@endpoints.route('/products', methods=['POST'])
+@jwt_required()
+@upload_admission
+@upload_limits(max_file_size=3 * 1024 * 1024, max_files=5)
+def create_product():
+    """
+    Body example (multipart/form-data):
+    {
+        "name": "Product Name",
+        "description": "Product Description",
+        "price": 100.00,
+        "images": list of image files (optional, can upload up to 5 images)
+    }
+    """
+    # Check if the user is an admin
+    current_user = get_jwt_identity()
+    user = User.query.get(int(current_user))
+    if not user or user.role != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    # Check if the request contains form data
+    body = request.form
+    if not body or "name" not in body or "description" not in body or "price" not in body:
+        return jsonify({"error": "Missing product data"}), 400
+    
+    # Check if a product with the same name already exists
+    existing_product = Product.query.filter_by(name=body["name"]).first()
+    if existing_product:
+        return jsonify({"error": "Product with this name already exists"}), 400
+    
+    # Validate price
+    try:
+        price = float(body["price"])
+        if price <= 0:
+            return jsonify({"error": "Price must be a positive number"}), 400
+    except ValueError:
+        return jsonify({"error": "Invalid price format"}), 400
+
+    # Extract product data from the form
+    name = body["name"]
+    description = body["description"]
+    price = float(body["price"])
+
+    images_urls = []
+
+    # Check if images are provided
+    if 'images' not in request.files or len(request.files.getlist('images')) == 0:
+        images_urls = [
+            {
+                "url": DEFAULT_PRODUCT_IMAGE_URL,
+                "public_id": None
+            }
+        ]
+    else:
+        image_files = request.files.getlist('images')
+        if len(image_files) > 5:
+            return jsonify({"error": "You can upload a maximum of 5 images"}), 400
+        
+        for image_file in image_files:
+            if image_file.filename == '':
+                return jsonify({"error": "No selected file"}), 400
+            
+            # Validate image file type
+            if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                return jsonify({"error": "Invalid image format"}), 400
+            
+            # The image file size (max 3MB) is checked by @upload_limits while the file is received
+            
+            try:
+                # Upload the image to Cloudinary
+                images_urls.append(upload_image(image_file))
+            except Exception as e:
+                return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
+
+
+    # Create a new product instance
+    new_product = Product(name=name, description=description, price=price)
+    try:
+        db.session.add(new_product)
+        db.session.commit() # After committing the product, we can get its ID to associate images
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to create product: {str(e)}"}), 500
+
+    # Save the images to the database
+    for image_data in images_urls:
+        new_image = ProductImage(
+            product_id=new_product.id,
+            url=image_data["url"],
+            public_id=image_data["public_id"]
+        )
+        db.session.add(new_image)
+    try:
+        db.session.commit()
+        return jsonify({"message": "Product created successfully", "product": new_product.serialize()}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to create product: {str(e)}"}), 500
+    
+    
+
+# Product update endpoint
+@endpoints.route('/products/<int:product_id>', methods=['PUT'])
+@jwt_required()
+@upload_admission
+@upload_limits(max_file_size=3 * 1024 * 1024, max_files=5)
+def update_product(product_id):
+    """
+    Body example (multipart/form-data):
+    {
+        "name": "Updated Product Name",
+        "description": "Updated Product Description",
+        "price": 150.00,
+        "image_files_to_add": list of image files (optional, can upload up to 5 new images),
+        "image_ids_to_delete": list of image IDs to delete (optional)
+    }
+    All fields are optional, but at least one must be provided.
+    """
+    # Check if the user is an admin
+    current_user = get_jwt_identity()
+    user = User.query.get(int(current_user))
+    if not user or user.role != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    product = Product.query.get(product_id)
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+
+    body = request.form
+    if not body or ("name" not in body and "description" not in body and "price" not in body and 'image' not in request.files):
+        return jsonify({"error": "Missing product data"}), 400
+    
+    # Update product fields if provided
+    if "name" in body:
+        # Check if a product with the same name already exists
+        existing_product = Product.query.filter_by(name=body["name"]).first()
+        if existing_product and existing_product.id != product_id:
+            return jsonify({"error": "Product with this name already exists"}), 400
+        # Update the product name
+        product.name = body["name"]
+    
+    if "description" in body:
+        product.description = body["description"]
+    
+    if "price" in body:
+        try:
+            price = float(body["price"])
+            if price <= 0:
+                return jsonify({"error": "Price must be a positive number"}), 400
+            product.price = price
+        except ValueError:
+            return jsonify({"error": "Invalid price format"}), 400
+
+    # Handle image updates
+    image_files = request.files.getlist('image_files_to_add')
+    image_ids_to_delete = request.form.getlist('image_ids_to_delete')
+    if len(image_files) > 5:
+        return jsonify({"error": "You can upload a maximum of 5 images"}), 400
+    if product.images and (len(product.images) + len(image_files) - len(image_ids_to_delete)) > 5:
+        return jsonify({"error": "Total images cannot exceed 5"}), 400
+    
+    # Delete specified images
+    for image_id in image_ids_to_delete:
+        image = ProductImage.query.get(image_id)
+        if not image or image.product_id != product_id:
+            return jsonify({"error": f"Image with ID {image_id} not found for this product"}), 404
+        try:
+            db.session.delete(image)
+            db.session.commit()
+            # Delete the image from Cloudinary if it exists
+            if image.public_id:
+                destroy_image(image.public_id)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Failed to delete image: {str(e)}"}), 500
+        
+    # Add new images
+    images_urls = []
+    if image_files:
+        for image_file in image_files:
+            if image_file.filename == '':
+                return jsonify({"error": "No selected file"}), 400
+            
+            # Validate image file type
+            if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                return jsonify({"error": "Invalid image format"}), 400
+            
+            # The image file size (max 3MB) is checked by @upload_limits while the file is received
+            
+            try:
+                # Upload the image to Cloudinary
+                images_urls.append(upload_image(image_file))
+            except Exception as e:
+                return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
+
+        # Save the new images to the database
+        for image_data in images_urls:
+            new_image = ProductImage(
+                product_id=product.id,
+                url=image_data["url"],
+                public_id=image_data["public_id"]
+            )
+            db.session.add(new_image)
+    try:
+        db.session.commit()
+        return jsonify({"message": "Product updated successfully", "product": product.serialize()}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to update product: {str(e)}"}), 500
+
+    
+    
+
+# Product delete endpoint
+@endpoints.route('/products/<int:product_id>', methods=['DELETE'])
+@jwt_required()
+def delete_product(product_id):
+    """
+    Deletes a product by ID
+    """
+    # Check if the user is an admin
+    current_user = get_jwt_identity()
+    user = User.query.get(int(current_user))
+    if not user or user.role != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    product = Product.query.get(product_id)
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+    
+    try:
+        db.session.delete(product)
+        db.session.commit()
+
+        # Delete the images from Cloudinary if it exists
+        if product.images:
+            for image in product.images:
+                if image.public_id:
+                    destroy_image(image.public_id)
+                    
+        return jsonify({"message": "Product deleted successfully"}), 200
+    except Exception as e:
+        return jsonify({"error": f"Failed to delete product: {str(e)}"}), 500
+
+############################################################################################# 
+
+# Product list endpoint
+@endpoints.route('/products', methods=['GET'])
+@jwt_required()
+@read_only
+def list_products():
+    """
+    Returns a list of all products
+    """
+    products = Product.query.all()
+    return jsonify({"products": [product.serialize() for product in products]}), 200
+
+
+# Product detail endpoint
+@endpoints.route('/products/<int:product_id>', methods=['GET'])
+@jwt_required()
+@read_only
+def get_product(product_id):
+    """
+    Returns the details of a specific product by ID
+    """
+    product = Product.query.get(product_id)
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify({"product": product.serialize()}), 200
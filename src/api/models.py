@@ -2,8 +2,11 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import String, Boolean, Enum
 from sqlalchemy.orm import Mapped, mapped_column
 import enum
+from api.cloudinary_client import avatar_variants
+from api.replicas import RoutingSession
 
-db = SQLAlchemy()
+# The session can send the reads of some endpoints to a read replica (see api/replicas.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
@@ -26,7 +29,9 @@ class User(db.Model):
             "id": self.id,
             "email": self.email,
             "role": self.role.value,
-            "picture_url": self.picture_url
+            "picture_url": self.picture_url,
+            # Use these in the front end instead of the original picture
+            "picture_variants": avatar_variants(self.picture_url) if self.picture_url else None
         }
 
     def __repr__(self):
@@ -58,7 +63,7 @@ class Product(db.Model):
 class ProductImage(db.Model):
     __tablename__ = 'product_image'
     id: Mapped[int] = mapped_column(primary_key=True)
-    product_id: Mapped[int] = mapped_column(db.ForeignKey('product.id'), nullable=False)
+    product_id: Mapped[int] = mapped_column(db.ForeignKey('product.id'), nullable=False, index=True)
     # Relevant for this Study Project ##############################################################################################
     url: Mapped[str] = mapped_column(String(500), nullable=False)
     public_id: Mapped[str] = mapped_column(String(200), nullable=False)
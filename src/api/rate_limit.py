@@ -0,0 +1,220 @@
+"""
+Rate limiting (token bucket) for /login and /register and admission control for the upload endpoints.
+
+Two storage backends are available:
+- MemoryBackend: the default, the limits are counted per worker process. With several workers each one
+  has its own buckets and its own UPLOAD_MAX_CONCURRENT slots (a sync worker only runs one request at a
+  time, so it never reaches the limit): it is only real admission control with a single worker.
+- RedisBackend: shared by every worker/instance, enabled by setting RATE_LIMIT_STORAGE_URL=redis://...
+  (requires the "redis" package). Needed for real admission control in production.
+The client IP comes from request.remote_addr, behind a proxy it needs PROXY_FIX_X_FOR (see app.py).
+"""
+import os
+import time
+import uuid
+import threading
+from functools import wraps
+from flask import request, jsonify, current_app
+
+try:
+    import redis  # Optional, only needed for the shared backend
+except ImportError:
+    redis = None
+
+DEFAULT_CONFIG = {
+    'RATE_LIMIT_ENABLED': os.getenv('RATE_LIMIT_ENABLED', '1') == '1',
+    'RATE_LIMIT_STORAGE_URL': os.getenv('RATE_LIMIT_STORAGE_URL'),
+    # Tokens refilled per minute and bucket size (max requests in a burst)
+    'LOGIN_RATE_PER_MINUTE': int(os.getenv('LOGIN_RATE_PER_MINUTE', 10)),
+    'LOGIN_BURST': int(os.getenv('LOGIN_BURST', 5)),
+    'REGISTER_RATE_PER_MINUTE': int(os.getenv('REGISTER_RATE_PER_MINUTE', 5)),
+    'REGISTER_BURST': int(os.getenv('REGISTER_BURST', 5)),
+    # Max uploads running at the same time, the rest get a 503
+    'UPLOAD_MAX_CONCURRENT': int(os.getenv('UPLOAD_MAX_CONCURRENT', 20)),
+    # A slot is considered lost (crashed worker) after this many seconds
+    'UPLOAD_SLOT_TIMEOUT': int(os.getenv('UPLOAD_SLOT_TIMEOUT', 120)),
+    'UPLOAD_RETRY_AFTER': int(os.getenv('UPLOAD_RETRY_AFTER', 5)),
+}
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, last refill time, seconds to refill the whole bucket)
+        self._slots = {}  # name -> {token: expiration time}
+        self._last_prune = time.monotonic()
+
+    def take(self, key, rate, capacity):
+        """
+        Takes one token from the bucket, rate is in tokens per second.
+        Returns (allowed, seconds to wait for the next token)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            tokens, last, refill_time = self._buckets.get(key, (capacity, now, capacity / rate))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, refill_time)
+                return True, 0
+            self._buckets[key] = (tokens, now, refill_time)
+            return False, (1 - tokens) / rate
+
+    def _prune(self, now):
+        # Forget the buckets that are full again, otherwise every client IP ever seen stays in memory
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for key, (tokens, last, refill_time) in list(self._buckets.items()):
+            if now - last > refill_time:
+                del self._buckets[key]
+
+    def acquire(self, name, limit, timeout):
+        now = time.monotonic()
+        with self._lock:
+            slots = self._slots.setdefault(name, {})
+            for token, expiration in list(slots.items()):
+                if expiration < now:
+                    del slots[token]
+            if len(slots) >= limit:
+                return None
+            token = uuid.uuid4().hex
+            slots[token] = now + timeout
+            return token
+
+    def release(self, name, token):
+        with self._lock:
+            self._slots.get(name, {}).pop(token, None)
+
+
+# Both scripts run atomically inside redis, so every worker sees the same counters
+TAKE_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+local last = tonumber(redis.call('HGET', KEYS[1], 'last') or ARGV[3])
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+tokens = math.min(capacity, tokens + (now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+return 1
+"""
+
+
+class RedisBackend:
+    def __init__(self, url, prefix="rate-limit:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required to use RATE_LIMIT_STORAGE_URL")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+
+    def take(self, key, rate, capacity):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, capacity, time.time()])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+    def acquire(self, name, limit, timeout):
+        now = time.time()
+        token = uuid.uuid4().hex
+        if self._acquire(keys=[self.prefix + name], args=[now, limit, now + timeout, token]):
+            return token
+        return None
+
+    def release(self, name, token):
+        self.client.zrem(self.prefix + name, token)
+
+
+def get_backend():
+    return current_app.extensions['rate_limit']
+
+
+def too_many_requests(message, retry_after, status_code=429):
+    response = jsonify({"error": message})
+    response.status_code = status_code
+    # Retry-After must be a whole number of seconds
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def client_ip():
+    return request.remote_addr or "unknown"
+
+
+def login_email():
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and isinstance(body.get("email"), str):
+        return body["email"].strip().lower()
+    return None
+
+
+def rate_limit(name, config_prefix, identities=(client_ip,)):
+    """
+    Decorator that allows {PREFIX}_BURST requests at once and {PREFIX}_RATE_PER_MINUTE
+    afterwards for each identity (ex: one bucket per client IP and another one per email).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if config['RATE_LIMIT_ENABLED']:
+                rate = config[config_prefix + '_RATE_PER_MINUTE'] / 60
+                capacity = config[config_prefix + '_BURST']
+                for identity in identities:
+                    value = identity()
+                    if value is None:
+                        continue
+                    allowed, retry_after = get_backend().take(f"{name}:{identity.__name__}:{value}", rate, capacity)
+                    if not allowed:
+                        return too_many_requests("Too many requests, please try again later", retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def upload_admission(view):
+    """
+    Decorator for the upload endpoints: only UPLOAD_MAX_CONCURRENT multipart requests run at
+    the same time, the rest are rejected right away (before reading the files) with a 503,
+    so the uploads can't take every worker and starve the read endpoints.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        if not config['RATE_LIMIT_ENABLED'] or request.mimetype != 'multipart/form-data':
+            return view(*args, **kwargs)
+        backend = get_backend()
+        token = backend.acquire("uploads", config['UPLOAD_MAX_CONCURRENT'], config['UPLOAD_SLOT_TIMEOUT'])
+        if token is None:
+            return too_many_requests("The server is busy with other uploads, please try again later",
+                                     config['UPLOAD_RETRY_AFTER'], status_code=503)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            backend.release("uploads", token)
+    return wrapper
+
+
+def setup_rate_limit(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    if app.config['RATE_LIMIT_STORAGE_URL']:
+        app.extensions['rate_limit'] = RedisBackend(app.config['RATE_LIMIT_STORAGE_URL'])
+    else:
+        app.extensions['rate_limit'] = MemoryBackend()
@@ -0,0 +1,166 @@
+"""
+Finds the drift between the images stored in Cloudinary and the public_ids saved in the database
+(used by the "flask reconcile-assets" command).
+Both sides are read in public_id order, page by page, and compared with a merge,
+so the memory used doesn't depend on the number of images.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, union
+from api.models import db, User, ProductImage
+from api.cloudinary_client import UPLOAD_FOLDER, DEFAULT_PUBLIC_IDS, get_uploader
+
+# public_ids of the project images start with the folder name (without the leading slash)
+FOLDER_PREFIX = UPLOAD_FOLDER.strip("/") + "/"
+# Max public_ids per delete call of the Admin API
+DELETE_BATCH_SIZE = 100
+
+
+class CloudinaryAssetClient:
+    """
+    Lists the images of the folder with the Search API (the Admin API listing can't be sorted by public_id)
+    """
+    def __init__(self, prefix=FOLDER_PREFIX, page_size=500):
+        self.prefix = prefix
+        self.page_size = page_size
+
+    def list_page(self, cursor=None):
+        get_uploader()  # makes sure the SDK is configured
+        from cloudinary.search import Search
+        search = Search().expression(f"public_id:{self.prefix}*").sort_by("public_id", "asc").max_results(self.page_size)
+        if cursor:
+            search = search.next_cursor(cursor)
+        result = search.execute()
+        resources = [{"public_id": r["public_id"], "created_at": r["created_at"]} for r in result.get("resources", [])]
+        return resources, result.get("next_cursor")
+
+    def delete(self, public_ids):
+        import cloudinary.api
+        cloudinary.api.delete_resources(public_ids)
+
+
+class FakeAssetClient:
+    """
+    In-memory replacement of CloudinaryAssetClient, to run the reconciliation without a Cloudinary account:
+    "flask reconcile-assets --fake-listing images.json", or create_app({"ASSET_CLIENT": FakeAssetClient([...])})
+    and app.test_cli_runner() in the tests
+    """
+    def __init__(self, resources, page_size=500):
+        # resources: public_ids or {"public_id": ..., "created_at": ...} dicts
+        self.resources = {}
+        for resource in resources:
+            if isinstance(resource, str):
+                resource = {"public_id": resource, "created_at": "2000-01-01T00:00:00Z"}
+            self.resources[resource["public_id"]] = resource
+        self.page_size = page_size
+        self.delete_calls = []
+
+    def list_page(self, cursor=None):
+        # The cursor is the last public_id of the previous page, so deleting images doesn't shift the pages
+        public_ids = sorted(public_id for public_id in self.resources if cursor is None or public_id > cursor)
+        page = [self.resources[public_id] for public_id in public_ids[:self.page_size]]
+        next_cursor = page[-1]["public_id"] if len(public_ids) > self.page_size else None
+        return page, next_cursor
+
+    def delete(self, public_ids):
+        self.delete_calls.append(list(public_ids))
+        for public_id in public_ids:
+            self.resources.pop(public_id, None)
+
+
+def iter_remote_resources(client):
+    cursor = None
+    while True:
+        resources, cursor = client.list_page(cursor)
+        yield from resources
+        if not cursor:
+            return
+
+
+def iter_local_public_ids(session, batch_size=1000):
+    images = select(ProductImage.public_id.label("public_id")).where(ProductImage.public_id.isnot(None))
+    users = select(User.picture_public_id.label("public_id")).where(User.picture_public_id.isnot(None))
+    public_ids = union(images, users).subquery()
+    order = public_ids.c.public_id
+    # Compare bytes like python does, not with the language rules of the database collation
+    if session.get_bind().dialect.name == "postgresql":
+        order = order.collate("C")
+    # yield_per streams the rows with a server side cursor instead of loading all of them
+    result = session.execute(select(public_ids.c.public_id).order_by(order), execution_options={"yield_per": batch_size})
+    for public_id in result.scalars():
+        yield public_id
+
+
+def ensure_sorted(public_ids, source, key=None):
+    # The merge is only correct if both sides are sorted the same way, stop instead of reporting wrong drift
+    previous = None
+    for item in public_ids:
+        value = key(item) if key else item
+        if previous is not None and value < previous:
+            raise ValueError(f"The {source} public_ids are not sorted ({previous!r} before {value!r})")
+        previous = value
+        yield item
+
+
+def diff_assets(local_public_ids, remote_resources):
+    """
+    Merges the two sorted iterables and yields ("orphaned", resource) for the images without a row
+    and ("missing", public_id) for the rows without an image
+    """
+    local = ensure_sorted((public_id for public_id in local_public_ids if public_id.startswith(FOLDER_PREFIX)), "database")
+    # The default images are referenced by url only
+    local = heapq.merge(local, sorted(DEFAULT_PUBLIC_IDS))
+    remote = ensure_sorted(remote_resources, "Cloudinary", key=lambda resource: resource["public_id"])
+
+    local_id = next(local, None)
+    resource = next(remote, None)
+    while local_id is not None or resource is not None:
+        if resource is None or (local_id is not None and local_id < resource["public_id"]):
+            # The default images only need protection, they may live in another account
+            if local_id not in DEFAULT_PUBLIC_IDS:
+                yield "missing", local_id
+            local_id = next(local, None)
+        elif local_id is None or resource["public_id"] < local_id:
+            yield "orphaned", resource
+            resource = next(remote, None)
+        else:
+            matched = local_id
+            resource = next(remote, None)
+            # the same public_id can appear twice on the local side (default images)
+            while local_id == matched:
+                local_id = next(local, None)
+
+
+def is_older_than(resource, minutes):
+    created_at = datetime.fromisoformat(resource["created_at"].replace("Z", "+00:00"))
+    return created_at < datetime.now(timezone.utc) - timedelta(minutes=minutes)
+
+
+def reconcile_assets(client, delete=False, min_age=60, report=print):
+    """
+    Reports the drift and, when delete is True, removes the orphaned images in batches.
+    Orphans younger than min_age minutes are skipped: they can belong to an upload whose row is not committed yet.
+    Returns the totals.
+    """
+    totals = {"orphaned": 0, "missing": 0, "skipped": 0, "deleted": 0}
+    batch = []
+    for kind, item in diff_assets(iter_local_public_ids(db.session), iter_remote_resources(client)):
+        if kind == "missing":
+            totals["missing"] += 1
+            report(f"Missing in Cloudinary: {item}")
+            continue
+        if not is_older_than(item, min_age):
+            totals["skipped"] += 1
+            continue
+        totals["orphaned"] += 1
+        report(f"Orphaned in Cloudinary: {item['public_id']}")
+        if delete:
+            batch.append(item["public_id"])
+            if len(batch) >= DELETE_BATCH_SIZE:
+                client.delete(batch)
+                totals["deleted"] += len(batch)
+                batch = []
+    if batch:
+        client.delete(batch)
+        totals["deleted"] += len(batch)
+    return totals
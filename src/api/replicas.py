@@ -0,0 +1,161 @@
+"""
+Optional read replicas. Set DATABASE_REPLICA_URLS to a comma separated list of database urls
+(ex: "sqlite:////tmp/replica1.db,sqlite:////tmp/replica2.db" to try it locally).
+- Only the endpoints decorated with @read_only query the replicas, in round-robin order.
+  Everything else, and anything that writes, uses the primary (DATABASE_URL).
+- A replica that fails is skipped for REPLICA_RETRY_INTERVAL seconds, then pinged before using it again.
+- After a request writes, the client gets a cookie that sends its reads to the primary during
+  REPLICA_STICKY_SECONDS, so it always sees its own changes even if the replicas are behind.
+- The migrations and db.create_all() only run on the primary, the replicas get the changes from it.
+"""
+import os
+import time
+import itertools
+import threading
+from functools import wraps
+from flask import g, request, current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+STICKY_COOKIE = "db_primary_until"
+
+
+class ReplicaRouter:
+    def __init__(self, engines, retry_interval=30):
+        self.engines = engines
+        self.retry_interval = retry_interval
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._down_until = {}  # engine -> time when it can be tried again
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error(engine))
+
+    def _on_error(self, engine):
+        def handle_error(context):
+            if isinstance(context.sqlalchemy_exception, OperationalError):
+                self.mark_down(engine)
+        return handle_error
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_interval
+
+    def is_healthy(self, engine):
+        with self._lock:
+            down_until = self._down_until.get(engine)
+            if down_until is None:
+                return True
+            if time.monotonic() < down_until:
+                return False
+            # Only one request pings the replica, the others keep skipping it meanwhile
+            self._down_until[engine] = time.monotonic() + self.retry_interval
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            return False
+        with self._lock:
+            self._down_until.pop(engine, None)
+        return True
+
+    def choose(self):
+        """
+        Next healthy replica in round-robin order, None when all of them are down
+        """
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._counter) % len(self.engines)]
+            if self.is_healthy(engine):
+                return engine
+        return None
+
+
+class RoutingSession(Session):
+    """
+    db.session class that sends the SELECTs of @read_only endpoints to a replica
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            # The same replica is used for the whole request, so the reads are consistent between them
+            if 'db_replica' not in g:
+                g.db_replica = get_router().choose()
+            if g.db_replica is not None:
+                return g.db_replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if not has_app_context() or not g.get('db_read_only'):
+            return False
+        # Anything that is being written goes to the primary
+        if self._flushing or self.new or self.dirty or self.deleted:
+            return False
+        return clause is None or getattr(clause, 'is_select', False)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def remember_write(session, flush_context):
+    if has_app_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def remember_bulk_write(orm_execute_state):
+    # session.execute(update(...)/delete(...)) writes without a flush (ex: the admin actions)
+    if has_app_context() and (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        g.db_wrote = True
+
+
+def get_router():
+    return current_app.extensions['replica_router']
+
+
+def read_only(view):
+    """
+    Decorator for the endpoints that only read from the database, their queries can use a replica
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        sticky_until = request.cookies.get(STICKY_COOKIE, "")
+        # Recent write from this client: read from the primary to see it
+        if get_router() is None or (sticky_until.isdigit() and int(sticky_until) > time.time()):
+            return view(*args, **kwargs)
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            if g.get('db_replica') is None:
+                raise
+            # The replica failed (it is skipped from now on), the view only reads so it can run again on the primary
+            db_session().rollback()
+            g.db_read_only = False
+            g.pop('db_replica')
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def db_session():
+    return current_app.extensions['sqlalchemy'].session
+
+
+def setup_replicas(app):
+    """
+    Creates the engines of the replicas and the router. They are not flask_sqlalchemy binds,
+    so db.create_all() and the migrations never run on them
+    """
+    app.config.setdefault('DATABASE_REPLICA_URLS', os.getenv("DATABASE_REPLICA_URLS", ""))
+    app.config.setdefault('REPLICA_RETRY_INTERVAL', int(os.getenv("REPLICA_RETRY_INTERVAL", 30)))
+    app.config.setdefault('REPLICA_STICKY_SECONDS', int(os.getenv("REPLICA_STICKY_SECONDS", 10)))
+    urls = [url.strip().replace("postgres://", "postgresql://") for url in app.config['DATABASE_REPLICA_URLS'].split(",") if url.strip()]
+    if not urls:
+        app.extensions['replica_router'] = None
+        return
+    engines = [create_engine(url, pool_pre_ping=True) for url in urls]
+    app.extensions['replica_router'] = ReplicaRouter(engines, app.config['REPLICA_RETRY_INTERVAL'])
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get('db_wrote'):
+            sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(int(time.time()) + sticky_seconds),
+                                max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,179 @@
+"""
+Static file serving for the built front end (the public/ folder).
+The folder is scanned once at startup into an in-memory manifest, so serving a file
+never touches the disk to check if it exists. Precompressed .br/.gz variants generated
+by "flask compress-static" are served when the browser accepts them.
+"""
+import os
+import re
+import json
+import gzip
+import mimetypes
+from flask import request, send_file
+
+try:
+    import brotli  # Optional, only needed to generate .br files
+except ImportError:
+    brotli = None
+
+# Build manifest written by vite when build.manifest is enabled, it lists the fingerprinted files.
+# Only used if it is inside the served folder (STATIC_FOLDER is public/, vite builds to dist/)
+BUILD_MANIFEST = '.vite/manifest.json'
+# Without a build manifest, a file is considered fingerprinted when the last part of its name is a hash
+# with letters and digits: vite (assets/index-B-2Ls_Zq.js) or webpack hex hashes (main.4f3a9c1b.js)
+FINGERPRINT_RE = re.compile(
+    r'(?:^assets/.*-(?=[A-Za-z0-9_-]{0,7}\d)(?=[A-Za-z0-9_-]{0,7}[A-Za-z])[A-Za-z0-9_-]{8}'
+    r'|[.-](?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{8,32})\.[A-Za-z0-9]+$'
+)
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.map', '.ico', '.xml')
+MIN_COMPRESS_SIZE = 1024
+# Order matters: brotli is preferred over gzip when both are accepted
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def file_etag(stat):
+    return "%x-%x" % (int(stat.st_mtime), stat.st_size)
+
+
+class StaticFile:
+    def __init__(self, root, path, fingerprinted=None):
+        self.path = path
+        self.full_path = os.path.join(root, path)
+        stat = os.stat(self.full_path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = file_etag(stat)
+        if fingerprinted is None:
+            self.immutable = FINGERPRINT_RE.search(path) is not None
+        else:
+            self.immutable = path in fingerprinted
+        self.immutable = self.immutable and path != 'index.html'
+        # Precompressed variants available on disk, ex: {"br": ("/.../index.js.br", etag)}
+        self.variants = {}
+        for encoding, extension in ENCODINGS:
+            variant_path = self.full_path + extension
+            if not os.path.isfile(variant_path):
+                continue
+            variant_stat = os.stat(variant_path)
+            # Left over from a previous build ("flask compress-static" was not run again), it has the old content
+            if variant_stat.st_mtime < stat.st_mtime:
+                continue
+            # Each representation needs its own ETag
+            self.variants[encoding] = (variant_path, "%s-%s" % (file_etag(variant_stat), encoding))
+
+
+def read_build_manifest(root):
+    """
+    Files listed in the vite build manifest (the ones with a content hash), None when there is no manifest
+    """
+    manifest_path = os.path.join(root, BUILD_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            chunks = json.load(f)
+    except ValueError:
+        return None
+    if not isinstance(chunks, dict):
+        return None
+    fingerprinted = set()
+    for chunk in chunks.values():
+        # Ignore anything that doesn't look like a vite chunk instead of failing at startup
+        if not isinstance(chunk, dict) or not isinstance(chunk.get('file'), str):
+            continue
+        fingerprinted.add(chunk['file'])
+        fingerprinted.update(chunk.get('css', []))
+        fingerprinted.update(chunk.get('assets', []))
+    return fingerprinted
+
+
+def build_manifest(root):
+    manifest = {}
+    if not os.path.isdir(root):
+        return manifest
+    fingerprinted = read_build_manifest(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            # The compressed variants are attached to their original file, not served by name
+            if filename.endswith(('.br', '.gz')) and filename[:-3] in filenames:
+                continue
+            path = os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/')
+            manifest[path] = StaticFile(root, path, fingerprinted)
+    return manifest
+
+
+def compress_static_files(root, level=9):
+    """
+    Writes a .gz (and .br when the brotli package is installed) next to every compressible
+    file of the folder. Returns the list of generated files.
+    """
+    generated = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            with open(full_path, 'rb') as f:
+                content = f.read()
+            if len(content) < MIN_COMPRESS_SIZE:
+                continue
+            compressed = {'.gz': gzip.compress(content, compresslevel=level, mtime=0)}
+            if brotli is not None:
+                compressed['.br'] = brotli.compress(content, quality=11)
+            for extension, data in compressed.items():
+                # Only keep the variant if it actually saves bytes
+                if len(data) >= len(content):
+                    continue
+                with open(full_path + extension, 'wb') as f:
+                    f.write(data)
+                generated.append(full_path + extension)
+    return generated
+
+
+def init_static_files(app, root):
+    manifest = build_manifest(root)
+    app.extensions['static_manifest'] = manifest
+    return manifest
+
+
+def serve_static_file(app, path):
+    manifest = app.extensions['static_manifest']
+    static_file = manifest.get(path) or manifest.get('index.html')
+    if static_file is None:
+        return "Not found", 404
+
+    file_path = static_file.full_path
+    etag = static_file.etag
+    encoding = None
+    for accepted, extension in ENCODINGS:
+        if accepted in static_file.variants and request.accept_encodings[accepted]:
+            encoding = accepted
+            file_path, etag = static_file.variants[accepted]
+            break
+
+    # The files without a hash in the name (index.html, bundle.js, images) can change with any deploy,
+    # the browser revalidates them every time (a 304 thanks to the ETag when they didn't change)
+    max_age = IMMUTABLE_MAX_AGE if static_file.immutable else 0
+
+    response = send_file(
+        file_path,
+        mimetype=static_file.mimetype,
+        download_name=os.path.basename(static_file.path),
+        etag=etag,
+        last_modified=static_file.mtime,
+        max_age=max_age,
+        conditional=True,
+    )
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if static_file.variants:
+        response.vary.add('Accept-Encoding')
+
+    if static_file.immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = False
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,113 @@
+"""
+Limits for the multipart uploads, enforced while the request body is being parsed.
+- MAX_CONTENT_LENGTH caps the whole request (werkzeug answers 413 without reading the rest).
+- The other bodies (json, urlencoded forms, or any request to an endpoint without @upload_limits) are
+  capped at MAX_BODY_SIZE: werkzeug reads them in memory at once, MAX_FORM_MEMORY_SIZE doesn't apply to them.
+- Each file is written to a spooled temp file: in memory up to UPLOAD_SPOOL_SIZE, on disk after that.
+- The limits of each endpoint (@upload_limits) are checked for every part as it arrives, so the first
+  invalid file (wrong type, too big, one file too many) stops the parsing right away.
+"""
+import os
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app, jsonify, request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+DEFAULT_CONFIG = {
+    # Bigger files are written to disk while they are received
+    'UPLOAD_SPOOL_SIZE': int(os.getenv('UPLOAD_SPOOL_SIZE', 512 * 1024)),
+    # Max size of the requests without files (login, register without picture, json bodies)
+    'MAX_BODY_SIZE': int(os.getenv('MAX_BODY_SIZE', 64 * 1024)),
+}
+
+
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}MB"
+    return f"{size // 1024}KB"
+
+
+class UploadRejected(BadRequest):
+    pass
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    pass
+
+
+def upload_limits(max_file_size, max_files=1, extensions=ALLOWED_EXTENSIONS):
+    """
+    Declares the upload limits of an endpoint, must be the decorator closest to the function
+    (the other decorators copy the attribute with functools.wraps)
+    """
+    def decorator(view):
+        view.upload_limits = {"max_file_size": max_file_size, "max_files": max_files, "extensions": extensions}
+        return view
+    return decorator
+
+
+class LimitedSpooledFile(SpooledTemporaryFile):
+    def __init__(self, max_size, max_file_size):
+        super().__init__(max_size=max_size, mode="rb+")
+        self.max_file_size = max_file_size
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.max_file_size is not None and self.written > self.max_file_size:
+            raise UploadTooLarge(f"Image file too large, must be less than {format_size(self.max_file_size)}")
+        return super().write(data)
+
+
+class UploadRequest(Request):
+    files_received = 0
+
+    def get_upload_limits(self):
+        view = current_app.view_functions.get(self.endpoint) if self.endpoint else None
+        return getattr(view, "upload_limits", None)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limits = self.get_upload_limits()
+        if limits is None:
+            # Endpoint without declared limits, it still gets the MAX_BODY_SIZE cap
+            return LimitedSpooledFile(current_app.config['UPLOAD_SPOOL_SIZE'], None)
+        # An empty filename is a file input left empty, the endpoint answers that one
+        if filename:
+            self.files_received += 1
+            if self.files_received > limits["max_files"]:
+                raise UploadRejected(f"You can upload a maximum of {limits['max_files']} images")
+            if not filename.lower().endswith(limits["extensions"]):
+                raise UploadRejected("Invalid image format")
+        if content_length is not None and content_length > limits["max_file_size"]:
+            raise UploadTooLarge(f"Image file too large, must be less than {format_size(limits['max_file_size'])}")
+        return LimitedSpooledFile(current_app.config['UPLOAD_SPOOL_SIZE'], limits["max_file_size"])
+
+
+def setup_uploads(app):
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.request_class = UploadRequest
+
+    @app.before_request
+    def limit_body_size():
+        # Runs before the body is read, werkzeug answers 413 as soon as the limit is passed
+        limits = request.get_upload_limits()
+        body_size = current_app.config['MAX_BODY_SIZE']
+        if limits is not None and request.mimetype == 'multipart/form-data':
+            # The files plus the text fields
+            body_size += limits["max_files"] * limits["max_file_size"]
+        request.max_content_length = min(body_size, current_app.config['MAX_CONTENT_LENGTH'])
+
+    # Answer the upload errors with json like the rest of the endpoints
+    @app.errorhandler(UploadRejected)
+    def handle_upload_rejected(error):
+        return jsonify({"error": error.description}), 400
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def handle_too_large(error):
+        if isinstance(error, UploadTooLarge):
+            message = error.description
+        else:
+            message = f"Request too large, must be less than {format_size(request.max_content_length)}"
+        return jsonify({"error": message}), 413
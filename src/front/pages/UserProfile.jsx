@@ -24,7 +24,7 @@ const UserProfile = () => {
             <div className="card-body text-center p-5">
               <div className="mb-4">
                 <img
-                  src={store.user?.picture_url}
+                  src={store.user?.picture_variants?.large || store.user?.picture_url}
                   alt="Foto de perfil"
                   className="rounded-circle border border-1 border-white"
                   style={{ width: 200, height: 200, objectFit: 'cover', boxShadow: '0 4px 24px rgba(0,0,0,0.1)' }}
@@ -0,0 +1,57 @@
+# Gunicorn configuration, used by the Procfile: $ gunicorn wsgi --chdir ./src/ --config ./src/gunicorn_config.py
+# Read more about the settings here: https://docs.gunicorn.org/en/stable/settings.html
+#
+# GUNICORN_MODE selects how the workers handle requests:
+#   sync   -> one request per worker process (gunicorn default, good for CPU bound work)
+#   gthread-> a pool of threads per worker, requests waiting on Cloudinary release the GIL
+#   async  -> gevent workers, every request is a greenlet so a single worker can hold hundreds
+#             of in-flight Cloudinary uploads (the SDK uses urllib3, which gevent makes cooperative)
+#
+# WEB_CONCURRENCY sets the number of worker processes (Heroku sets it from the dyno size). When it is not
+# set gunicorn's default of 1 worker is kept: the CPU count seen inside a container is usually the one of
+# the host, a worker per core can go over the memory of a small instance (512MB on the Render free plan).
+# A good value is 2-4 workers per available core for sync, about one per core for gthread/async.
+import os
+
+mode = os.getenv("GUNICORN_MODE", "sync")
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+
+if mode == "async":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+elif mode == "gthread":
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", 8))
+elif mode == "sync":
+    worker_class = "sync"
+else:
+    raise ValueError(f"Invalid GUNICORN_MODE '{mode}', must be 'sync', 'gthread' or 'async'")
+
+# Uploads of several images can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+# Keep the connections from the load balancer open between requests
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle the workers from time to time (avoids memory leaks), the jitter avoids restarting all of them at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+
+def when_ready(server):
+    # Without redis every worker counts its own rate limits and upload slots
+    if not os.getenv("RATE_LIMIT_STORAGE_URL") and (server.cfg.workers > 1 or mode == "sync"):
+        server.log.warning(
+            "Rate limits are counted per worker (%s %s workers): UPLOAD_MAX_CONCURRENT is not a global limit. "
+            "Set RATE_LIMIT_STORAGE_URL to share the limits between the workers", server.cfg.workers, mode)
+
+
+def post_fork(server, worker):
+    if mode != "async":
+        return
+    # psycopg2 blocks the whole worker while waiting for postgres unless it is patched for gevent
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen is not installed, database queries will block the gevent worker")
+        return
+    patch_psycopg()
@@ -0,0 +1,69 @@
+"""
+Runs "flask reconcile-assets" against FakeAssetClient, no Cloudinary account needed:
+$ pipenv run test
+"""
+import json
+import pytest
+from app import create_app
+from api.models import db, User, Product, ProductImage
+from api.reconcile import FOLDER_PREFIX, DELETE_BATCH_SIZE, FakeAssetClient
+
+OLD = "2000-01-01T00:00:00Z"
+RECENT = "2999-01-01T00:00:00Z"
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "ADMIN_ENABLED": False,
+        "RATE_LIMIT_ENABLED": False,
+    })
+    with app.app_context():
+        db.create_all()
+        product = Product(name="Product", description="Description", price=1)
+        db.session.add(product)
+        for x in range(5):
+            db.session.add(ProductImage(product=product, url="url", public_id=f"{FOLDER_PREFIX}product_{x}"))
+        db.session.add(User(email="user@test.com", password="hash", picture_public_id=f"{FOLDER_PREFIX}avatar"))
+        db.session.commit()
+    return app
+
+
+def remote_images(orphans):
+    # Every row has its image except product_4, plus the orphans and one recent upload without row
+    resources = [{"public_id": f"{FOLDER_PREFIX}product_{x}", "created_at": OLD} for x in range(4)]
+    resources.append({"public_id": f"{FOLDER_PREFIX}avatar", "created_at": OLD})
+    resources += [{"public_id": f"{FOLDER_PREFIX}orphan_{x:03}", "created_at": OLD} for x in range(orphans)]
+    resources.append({"public_id": f"{FOLDER_PREFIX}uploading", "created_at": RECENT})
+    return resources
+
+
+def test_reconcile_reports_and_deletes_in_batches(app):
+    orphans = DELETE_BATCH_SIZE + 20
+    client = FakeAssetClient(remote_images(orphans), page_size=7)
+    app.config["ASSET_CLIENT"] = client
+
+    result = app.test_cli_runner().invoke(args=["reconcile-assets", "--delete"])
+
+    assert result.exit_code == 0, result.output
+    assert f"Missing in Cloudinary: {FOLDER_PREFIX}product_4" in result.output
+    assert f"Orphaned images in Cloudinary: {orphans} (deleted: {orphans})" in result.output
+    assert "Recent images skipped: 1" in result.output
+    assert [len(batch) for batch in client.delete_calls] == [DELETE_BATCH_SIZE, 20]
+    # Only the orphans are gone, the images with a row and the recent upload are kept
+    assert sorted(client.resources) == sorted(
+        [f"{FOLDER_PREFIX}product_{x}" for x in range(4)] + [f"{FOLDER_PREFIX}avatar", f"{FOLDER_PREFIX}uploading"]
+    )
+
+
+def test_reconcile_fake_listing_option(app, tmp_path):
+    listing = tmp_path / "images.json"
+    listing.write_text(json.dumps(remote_images(3)))
+
+    result = app.test_cli_runner().invoke(args=["reconcile-assets", "--fake-listing", str(listing), "--page-size", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert f"Orphaned in Cloudinary: {FOLDER_PREFIX}orphan_002" in result.output
+    assert "Orphaned images in Cloudinary: 3 (deleted: 0)" in result.output
+    assert "Rows without image in Cloudinary: 1" in result.output